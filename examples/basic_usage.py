@@ -5,7 +5,7 @@ Basic usage example for Talk to Your PC MCP Server
 
 import asyncio
 import os
-from src.talk_to_your_pc_mcp_server.server import run_diagnosis, get_pc_settings, execute_troubleshooting
+from talk_to_your_pc_mcp_server.server import run_diagnosis, get_pc_settings, execute_troubleshooting
 
 async def main():
     """Example usage of the MCP server tools"""
@@ -61,6 +61,10 @@ setup(
     python_requires=">=3.8",
     install_requires=requirements,
     extras_require={
+        "semantic": [
+            "numpy>=1.21.0",
+            "sentence-transformers>=2.2.0",
+        ],
         "dev": [
             "pytest>=7.0.0",
             "pytest-asyncio>=0.21.0",
@@ -5,6 +5,7 @@ Command line interface for Talk to Your PC MCP Server
 
 import argparse
 import asyncio
+import logging
 import sys
 from .server import main
 
@@ -44,11 +45,9 @@ For Claude Desktop setup, see: https://github.com/Irene-123/talk-to-your-pc-mcp-
     args = parser.parse_args()
     
     if args.debug:
-        import logging
         logging.basicConfig(level=logging.DEBUG)
     
     try:
-        import asyncio
         asyncio.run(main())  # This is the fix - use asyncio.run()
     except KeyboardInterrupt:
         print("\n👋 Talk to Your PC MCP Server stopped")
@@ -1,102 +1,192 @@
 """
 LLM Client integrations for OpenAI, Claude (Anthropic), and Azure OpenAI
 """
+import hashlib
+import json
+import logging
 import os
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
 from abc import ABC, abstractmethod
 
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """Exact-match response cache with TTL and LRU eviction"""
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 3600):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(system_prompt: str, user_prompt: str, model: str = "") -> str:
+        payload = json.dumps({"s": system_prompt, "u": user_prompt, "m": model}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.monotonic() - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+class LLMResult(NamedTuple):
+    """LLM reply text, and whether it came from the model rather than an error fallback"""
+    text: str
+    ok: bool
+
+class LLMError(Exception):
+    """Raised by a client when the provider returned no usable text"""
+
 class BaseLLMClient(ABC):
+    provider_name = "LLM"
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self, "model", "")
+
     @abstractmethod
-    def get_response(self, system_prompt: str, user_prompt: str) -> str:
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        """Call the provider and return its text, raising on any failure"""
         pass
 
+    def get_result(self, system_prompt: str, user_prompt: str) -> LLMResult:
+        """Get a response, falling back to an echo command describing the error"""
+        try:
+            return LLMResult(self.generate(system_prompt, user_prompt), True)
+        except LLMError as e:
+            return LLMResult(f'{{"command": "echo \\"{e}\\""}}', False)
+        except Exception as e:
+            return LLMResult(f'{{"command": "echo \\"{self.provider_name} Error: {str(e)}\\""}}', False)
+
+    def get_response(self, system_prompt: str, user_prompt: str) -> str:
+        return self.get_result(system_prompt, user_prompt).text
+
 class OpenAIClient(BaseLLMClient):
+    provider_name = "OpenAI"
+
     def __init__(self, api_key: str, model: str = "gpt-3.5-turbo"):
         self.api_key = api_key
         self.model = model
         
-    def get_response(self, system_prompt: str, user_prompt: str) -> str:
-        try:
-            import openai
-            client = openai.OpenAI(api_key=self.api_key)
-            
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=1000
-            )
-            
-            content = response.choices[0].message.content
-            return content if content is not None else '{"command": "echo \\"Empty response from OpenAI\\""}'
-            
-        except Exception as e:
-            return f'{{"command": "echo \\"OpenAI Error: {str(e)}\\""}}'
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        import openai
+        client = openai.OpenAI(api_key=self.api_key)
+        
+        response = client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.1,
+            max_tokens=1000
+        )
+        
+        content = response.choices[0].message.content
+        if content is None:
+            raise LLMError("Empty response from OpenAI")
+        return content
 
 class AnthropicClient(BaseLLMClient):
+    provider_name = "Claude"
+
     def __init__(self, api_key: str, model: str = "claude-3-haiku-20240307"):
         self.api_key = api_key
         self.model = model
         
-    def get_response(self, system_prompt: str, user_prompt: str) -> str:
-        try:
-            import anthropic
-            client = anthropic.Anthropic(api_key=self.api_key)
-            
-            response = client.messages.create(
-                model=self.model,
-                max_tokens=1000,
-                temperature=0.1,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ]
-            )
-            
-            for block in response.content:
-                if hasattr(block, 'text'):
-                    return block.text # type: ignore
-
-            return '{"command": "echo \\"No text content in response\\""}'
-
-            
-        except Exception as e:
-            return f'{{"command": "echo \\"Claude Error: {str(e)}\\""}}'
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        import anthropic
+        client = anthropic.Anthropic(api_key=self.api_key)
+        
+        response = client.messages.create(
+            model=self.model,
+            max_tokens=1000,
+            temperature=0.1,
+            system=system_prompt,
+            messages=[
+                {"role": "user", "content": user_prompt}
+            ]
+        )
+        
+        for block in response.content:
+            if hasattr(block, 'text'):
+                return block.text # type: ignore
+
+        raise LLMError("No text content in response")
 
 class AzureOpenAIClient(BaseLLMClient):
+    provider_name = "Azure"
+
     def __init__(self, api_key: str, endpoint: str, deployment_name: str, api_version: str = "2024-02-15-preview"):
         self.api_key = api_key
         self.endpoint = endpoint
         self.deployment_name = deployment_name
         self.api_version = api_version
+
+    @property
+    def model_name(self) -> str:
+        return self.deployment_name
         
-    def get_response(self, system_prompt: str, user_prompt: str) -> str:
-        try:
-            from openai import AzureOpenAI
-            client = AzureOpenAI(
-                api_key=self.api_key,
-                api_version=self.api_version,
-                azure_endpoint=self.endpoint
-            )
-            
-            response = client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=1000
-            )
-            
-            content = response.choices[0].message.content
-            return content if content is not None else '{"command": "echo \\"Empty response from Azure\\""}'
-            
-        except Exception as e:
-            return f'{{"command": "echo \\"Azure Error: {str(e)}\\""}}' 
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        from openai import AzureOpenAI
+        client = AzureOpenAI(
+            api_key=self.api_key,
+            api_version=self.api_version,
+            azure_endpoint=self.endpoint
+        )
+        
+        response = client.chat.completions.create(
+            model=self.deployment_name,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.1,
+            max_tokens=1000
+        )
+        
+        content = response.choices[0].message.content
+        if content is None:
+            raise LLMError("Empty response from Azure")
+        return content
 
 class LLMClientFactory:
     @staticmethod
@@ -107,14 +197,14 @@ class LLMClientFactory:
         openai_key = os.getenv("OPENAI_API_KEY")
         if openai_key:
             model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
-            print(f"🤖 Using OpenAI with model: {model}")
+            logger.debug("🤖 Using OpenAI with model: %s", model)
             return OpenAIClient(openai_key, model)
         
         # Try Claude/Anthropic
         claude_key = os.getenv("ANTHROPIC_API_KEY")
         if claude_key:
             model = os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
-            print(f"🤖 Using Claude with model: {model}")
+            logger.debug("🤖 Using Claude with model: %s", model)
             return AnthropicClient(claude_key, model)
         
         # Try Azure OpenAI
@@ -124,20 +214,62 @@ class LLMClientFactory:
         
         if azure_key and azure_endpoint and azure_deployment:
             api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
-            print(f"🤖 Using Azure OpenAI with deployment: {azure_deployment}")
+            logger.debug("🤖 Using Azure OpenAI with deployment: %s", azure_deployment)
             return AzureOpenAIClient(azure_key, azure_endpoint, azure_deployment, api_version)
         
-        print("❌ No LLM API keys found! Set one of:")
-        print("   - OPENAI_API_KEY")
-        print("   - ANTHROPIC_API_KEY") 
-        print("   - AZURE_OPENAI_API_KEY + AZURE_OPENAI_ENDPOINT + AZURE_OPENAI_DEPLOYMENT_NAME")
+        logger.warning(
+            "❌ No LLM API keys found! Set one of:\n"
+            "   - OPENAI_API_KEY\n"
+            "   - ANTHROPIC_API_KEY\n"
+            "   - AZURE_OPENAI_API_KEY + AZURE_OPENAI_ENDPOINT + AZURE_OPENAI_DEPLOYMENT_NAME"
+        )
         return None
 
-# Convenience function
-def get_llm_response(system_prompt: str, user_prompt: str) -> str:
-    """Get LLM response using auto-detected provider"""
+llm_cache = LLMCache(
+    maxsize=int(os.getenv("LLM_CACHE_MAXSIZE", "1024")),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL", "3600")),
+)
+
+def get_cache_stats() -> dict:
+    """Return hit/miss counters for the LLM response cache"""
+    return llm_cache.stats()
+
+# Returned when no provider is configured
+NO_CLIENT_RESULT = LLMResult('{"command": "echo \\"Please set up an LLM API key\\""}', False)
+
+def llm_cache_key(client: BaseLLMClient, system_prompt: str, user_prompt: str) -> str:
+    """Response cache key: the prompts plus the provider and model that answer them"""
+    return LLMCache.make_key(system_prompt, user_prompt, f"{type(client).__name__}:{client.model_name}")
+
+def get_cached_result(key: str) -> Optional[LLMResult]:
+    """Return the cached response for key, if any"""
+    cached = llm_cache.get(key)
+    if cached is None:
+        return None
+    logger.debug("LLM cache hit: %s", llm_cache.stats())
+    return LLMResult(cached, True)
+
+def fetch_llm_result(client: BaseLLMClient, key: str, system_prompt: str, user_prompt: str) -> LLMResult:
+    """Call the provider and cache the response if it succeeded"""
+    result = client.get_result(system_prompt, user_prompt)
+    if result.ok:
+        llm_cache.set(key, result.text)
+    return result
+
+# Convenience functions
+def get_llm_result(system_prompt: str, user_prompt: str) -> LLMResult:
+    """Get LLM response using auto-detected provider, flagging error fallbacks"""
     client = LLMClientFactory.create_client()
     if not client:
-        return '{"command": "echo \\"Please set up an LLM API key\\""}'
-    
-    return client.get_response(system_prompt, user_prompt)
\ No newline at end of file
+        return NO_CLIENT_RESULT
+
+    key = llm_cache_key(client, system_prompt, user_prompt)
+    cached = get_cached_result(key)
+    if cached is not None:
+        return cached
+
+    return fetch_llm_result(client, key, system_prompt, user_prompt)
+
+def get_llm_response(system_prompt: str, user_prompt: str) -> str:
+    """Get LLM response using auto-detected provider"""
+    return get_llm_result(system_prompt, user_prompt).text
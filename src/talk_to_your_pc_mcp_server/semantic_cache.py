@@ -0,0 +1,118 @@
+"""
+Semantic cache for tool results, matching rephrased requests by embedding similarity
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Tools whose results may be served from the cache. execute_troubleshooting is
+# deliberately excluded: it changes system state, so it must always run.
+CACHEABLE_TOOLS = ("run_diagnosis", "get_pc_settings")
+
+logger = logging.getLogger(__name__)
+
+
+class _ToolIndex:
+    """L2-normalized embedding matrix plus the entries it points at"""
+
+    def __init__(self):
+        self.embeddings: Any = None
+        self.entries: List[Tuple[str, str, float]] = []  # (input_text, result, timestamp)
+
+
+class SemanticCache:
+    """Per-tool cache that returns a previous result when the new input is similar enough"""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", threshold: float = 0.92,
+                 ttl_seconds: float = 300, maxsize: int = 256):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._model = None
+        self._indexes: Dict[str, _ToolIndex] = {}
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> Any:
+        """Embed text with the local sentence-transformers model (loaded on first use)"""
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode([text], normalize_embeddings=True)[0]
+
+    def lookup(self, tool_name: str, embedding: Any) -> Optional[str]:
+        """Return the cached result for the nearest fresh entry above the threshold"""
+        with self._lock:
+            index = self._indexes.get(tool_name)
+            if index is None or index.embeddings is None:
+                return None
+
+            return self._best_match(index, embedding)
+
+    def add(self, tool_name: str, embedding: Any, input_text: str, result: str) -> None:
+        """Store a tool result under its input embedding"""
+        import numpy as np
+
+        with self._lock:
+            index = self._indexes.setdefault(tool_name, _ToolIndex())
+            # Concurrent near-identical requests can both miss and finish; keep one entry
+            if index.embeddings is not None and self._best_match(index, embedding) is not None:
+                return
+
+            row = embedding.reshape(1, -1)
+            if index.embeddings is None:
+                index.embeddings = row
+            else:
+                index.embeddings = np.vstack([index.embeddings, row])
+            index.entries.append((input_text, result, time.monotonic()))
+
+            overflow = len(index.entries) - self.maxsize
+            if overflow > 0:
+                index.embeddings = index.embeddings[overflow:]
+                del index.entries[:overflow]
+
+    def _best_match(self, index: _ToolIndex, embedding: Any) -> Optional[str]:
+        # Caller must hold self._lock
+        self._evict_expired(index)
+        if not index.entries:
+            return None
+
+        sims = index.embeddings @ embedding
+        best = int(sims.argmax())
+        if sims[best] >= self.threshold:
+            return index.entries[best][1]
+        return None
+
+    def _evict_expired(self, index: _ToolIndex) -> None:
+        # Entries are appended in time order, so expired ones form a prefix
+        now = time.monotonic()
+        expired = 0
+        for _, _, stored_at in index.entries:
+            if now - stored_at < self.ttl_seconds:
+                break
+            expired += 1
+        if expired:
+            index.embeddings = index.embeddings[expired:]
+            del index.entries[:expired]
+
+
+def create_semantic_cache() -> Optional[SemanticCache]:
+    """Create the semantic cache if enabled via SEMANTIC_CACHE and its dependencies are installed"""
+    if os.getenv("SEMANTIC_CACHE", "false").lower() not in ("1", "true", "yes"):
+        return None
+
+    try:
+        import numpy  # noqa: F401
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        logger.warning("⚠️  SEMANTIC_CACHE is enabled but sentence-transformers is not installed; "
+                       "install with: pip install talk-to-pc-mcp[semantic]")
+        return None
+
+    return SemanticCache(
+        model_name=os.getenv("SEMANTIC_CACHE_MODEL", "all-MiniLM-L6-v2"),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "300")),
+    )
@@ -5,24 +5,42 @@ Just the 3 core tools: run_diagnosis, get_pc_settings, execute_troubleshooting
 """
 
 import asyncio
+import functools
 import json
+import logging
 import subprocess
 import platform
 import os
-from typing import Any, Dict
+import re
+import weakref
+from typing import Any, Dict, NamedTuple
 
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
 from mcp.server.stdio import stdio_server
 from mcp.types import (
     CallToolRequest,
+    CallToolRequestParams,
     CallToolResult,
     ListToolsRequest,
     ListToolsResult,
+    ServerCapabilities,
     Tool,
     TextContent,
 )
 
+from .llm_config import (
+    NO_CLIENT_RESULT,
+    BaseLLMClient,
+    LLMClientFactory,
+    LLMResult,
+    fetch_llm_result,
+    get_cached_result,
+    llm_cache_key,
+)
+from .semantic_cache import CACHEABLE_TOOLS, create_semantic_cache
+
+logger = logging.getLogger(__name__)
 
 OS_TYPE = platform.system().lower()
 
@@ -32,30 +50,80 @@ RISKY_KEYWORDS = [
     "shutdown", "reboot", "sudo rm", "rmdir /s", "reg delete"
 ]
 
+# Shell used to run commands, chosen once for the host OS
+if OS_TYPE == "windows":
+    SHELL_PREFIX = ("powershell", "-Command")
+else:  # Linux/Mac
+    SHELL_PREFIX = ("bash", "-c")
+
+
+# Cap concurrent provider requests to stay under rate limits (avoids 429 retries)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# Semaphores bind to an event loop, so create one per running loop rather than at import
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphore
+
+# LLM calls currently in progress, so identical concurrent prompts share one request.
+# Keyed like the response cache, so different providers/models never share a call.
+_inflight_llm: Dict[str, "asyncio.Task[LLMResult]"] = {}
+
+def _forget_inflight_llm(key: str, task: "asyncio.Task[LLMResult]") -> None:
+    _inflight_llm.pop(key, None)
+    # Retrieve the exception so a failure whose waiters were all cancelled isn't
+    # logged as "Task exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+async def _call_llm(client: BaseLLMClient, key: str, system_prompt: str, user_prompt: str) -> LLMResult:
+    async with _llm_semaphore():
+        return await asyncio.to_thread(fetch_llm_result, client, key, system_prompt, user_prompt)
+
+async def _llm(system_prompt: str, user_prompt: str) -> LLMResult:
+    """Get LLM response without blocking the event loop"""
+    client = LLMClientFactory.create_client()
+    if client is None:
+        return NO_CLIENT_RESULT
+
+    # Cache hits are answered here, without waiting for a semaphore slot or a thread
+    key = llm_cache_key(client, system_prompt, user_prompt)
+    cached = get_cached_result(key)
+    if cached is not None:
+        return cached
+
+    task = _inflight_llm.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_call_llm(client, key, system_prompt, user_prompt))
+        _inflight_llm[key] = task
+        task.add_done_callback(functools.partial(_forget_inflight_llm, key))
+    # Shield so one caller being cancelled doesn't cancel the shared call
+    return await asyncio.shield(task)
 
-from .llm_config import get_llm_response
+class ToolOutput(NamedTuple):
+    """Tool reply text, and whether every LLM call and command in the pipeline succeeded"""
+    text: str
+    ok: bool
 
 def execute_command(command: str) -> tuple[str, str, int]:
     """Execute system command safely"""
     try:
         # Check for risky keywords
+        lowered = command.lower()
         for keyword in RISKY_KEYWORDS:
-            if keyword.lower() in command.lower():
+            if keyword in lowered:
                 return f"BLOCKED: Command contains risky keyword: {keyword}", "", 1
         
-        # Choose shell based on OS
-        if OS_TYPE == "windows":
-            process = subprocess.Popen(
-                ["powershell", "-Command", command], 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE
-            )
-        else:  # Linux/Mac
-            process = subprocess.Popen(
-                ["bash", "-c", command], 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE
-            )
+        process = subprocess.Popen(
+            [*SHELL_PREFIX, command], 
+            stdout=subprocess.PIPE, 
+            stderr=subprocess.PIPE
+        )
         
         try:
             stdout, stderr = process.communicate(timeout=15)
@@ -67,8 +135,8 @@ def execute_command(command: str) -> tuple[str, str, int]:
     except Exception as e:
         return "", f"Execution error: {str(e)}", 1
 
-async def run_diagnosis(input_text: str) -> str:
-    """Run system diagnosis to find probable issues"""
+async def _run_diagnosis(input_text: str) -> ToolOutput:
+    """Run system diagnosis, reporting whether every step succeeded"""
     
     # Create OS-specific system prompt
     if OS_TYPE == "windows":
@@ -81,7 +149,8 @@ async def run_diagnosis(input_text: str) -> str:
         Examples: ps aux, netstat, dmesg, df -h, top"""
     
     # Get command from LLM
-    response = get_llm_response(system_prompt, input_text)
+    reply = await _llm(system_prompt, input_text)
+    response = reply.text
     
     # DEBUG: Print the raw response
     # print(f"🔍 DEBUG - Raw LLM response: {repr(response)}")
@@ -91,16 +160,16 @@ async def run_diagnosis(input_text: str) -> str:
         # print(f"🔍 DEBUG - Parsed JSON: {command_json}")
         
         if 'command' not in command_json:
-            return f"Error: LLM response missing 'command' key: {response}"
+            return ToolOutput(f"Error: LLM response missing 'command' key: {response}", False)
             
         command = command_json['command']
         # print(f"🔍 DEBUG - Command to execute: {command}")
         
-        stdout, stderr, returncode = execute_command(command)
+        stdout, stderr, returncode = await asyncio.to_thread(execute_command, command)
         # print(f"🔍 DEBUG - Command result: stdout='{stdout[:100]}...', stderr='{stderr}', returncode={returncode}")
         
         if returncode != 0:
-            return f"Diagnosis failed: {stderr}"
+            return ToolOutput(f"Diagnosis failed: {stderr}", False)
         
         # Analyze results with LLM
         analysis_prompt = """Analyze this system diagnostic output and explain if any issues were found. 
@@ -108,21 +177,21 @@ async def run_diagnosis(input_text: str) -> str:
         Be concise and helpful."""
         
         analysis_input = f"User issue: {input_text}\nDiagnostic output: {stdout}"
-        analysis = get_llm_response(analysis_prompt, analysis_input)
+        analysis = await _llm(analysis_prompt, analysis_input)
         
         # print(f"🔍 DEBUG - Analysis response: {repr(analysis)}")
         
-        return analysis
+        return ToolOutput(analysis.text, reply.ok and analysis.ok)
         
     except json.JSONDecodeError as e:
-        return f"JSON parsing error: {e}. Raw response: {response}"
+        return ToolOutput(f"JSON parsing error: {e}. Raw response: {response}", False)
     except KeyError as e:
-        return f"Missing key in response: {e}. Response: {response}"
+        return ToolOutput(f"Missing key in response: {e}. Response: {response}", False)
     except Exception as e:
-        return f"Diagnosis error: {str(e)}"
+        return ToolOutput(f"Diagnosis error: {str(e)}", False)
 
-async def get_pc_settings(input_text: str) -> str:
-    """Get PC settings information"""
+async def _get_pc_settings(input_text: str) -> ToolOutput:
+    """Get PC settings information, reporting whether every step succeeded"""
         
     if OS_TYPE == "windows":
         system_prompt = """You are a Windows system analyst. Write a PowerShell command to get the PC setting requested.
@@ -133,28 +202,29 @@ async def get_pc_settings(input_text: str) -> str:
         IMPORTANT: Return ONLY raw JSON, no markdown, no explanations, no code blocks.
         Format: {"command": "your-bash-command-here"}"""
     # Get command from LLM
-    response = get_llm_response(system_prompt, input_text)
+    reply = await _llm(system_prompt, input_text)
+    response = reply.text
     try:
         clean_response = extract_json_from_response(response)
         command_json = json.loads(clean_response)
-        stdout, stderr, returncode = execute_command(command_json['command'])
+        stdout, stderr, returncode = await asyncio.to_thread(execute_command, command_json['command'])
         
         if returncode != 0:
-            return f"Could not get setting: {stderr}"
+            return ToolOutput(f"Could not get setting: {stderr}", False)
         
         # Format results with LLM
         format_prompt = """Format this system output into a user-friendly response."""
         
         format_input = f"User requested: {input_text}\nSystem output: {stdout}"
-        formatted = get_llm_response(format_prompt, format_input)
+        formatted = await _llm(format_prompt, format_input)
         
-        return formatted
+        return ToolOutput(formatted.text, reply.ok and formatted.ok)
         
     except Exception as e:
-        return f"Settings error: {str(e)}"
+        return ToolOutput(f"Settings error: {str(e)}", False)
 
-async def execute_troubleshooting(input_text: str) -> str:
-    """Execute troubleshooting commands"""
+async def _execute_troubleshooting(input_text: str) -> ToolOutput:
+    """Execute troubleshooting commands, reporting whether every step succeeded"""
     
     # Create OS-specific system prompt
     if OS_TYPE == "windows":
@@ -167,7 +237,8 @@ async def execute_troubleshooting(input_text: str) -> str:
         Examples: sudo systemctl restart, killall, brew services restart"""
     
     # Get command from LLM
-    response = get_llm_response(system_prompt, input_text)
+    reply = await _llm(system_prompt, input_text)
+    response = reply.text
     
     # DEBUG: Print the raw response
     # print(f"DEBUG - Raw LLM response: '{response}'")
@@ -176,23 +247,23 @@ async def execute_troubleshooting(input_text: str) -> str:
     
     # Check for empty response
     if not response or response.strip() == "":
-        return "Error: LLM returned empty response. Check API key and connection."
+        return ToolOutput("Error: LLM returned empty response. Check API key and connection.", False)
     try:
         clean_response = extract_json_from_response(response)
         command_json = json.loads(clean_response)
         if 'command' not in command_json:
-            return f"Error: Response missing 'command' key. Got: {response}"
+            return ToolOutput(f"Error: Response missing 'command' key. Got: {response}", False)
             
         command = command_json['command']
         
         # Extra safety check for troubleshooting
         if any(risky in command.lower() for risky in ["format", "rm -rf", "del /f"]):
-            return "BLOCKED: Troubleshooting command too risky"
+            return ToolOutput("BLOCKED: Troubleshooting command too risky", False)
         
-        stdout, stderr, returncode = execute_command(command)
+        stdout, stderr, returncode = await asyncio.to_thread(execute_command, command)
         
         if returncode != 0:
-            return f"Troubleshooting failed: {stderr}"
+            return ToolOutput(f"Troubleshooting failed: {stderr}", False)
         
         # Summarize results
         summary_prompt = """Summarize what troubleshooting action was taken, result, andb output the command run and its output for user to see and verify. 
@@ -200,75 +271,94 @@ async def execute_troubleshooting(input_text: str) -> str:
         Suggest some next steps, and always output the command run and its output for user to see and verify."""
         
         summary_input = f"Action: {input_text}\nCommand: {command}\nOutput: {stdout}"
-        summary = get_llm_response(summary_prompt, summary_input)
+        summary = await _llm(summary_prompt, summary_input)
         
-        return summary
+        return ToolOutput(summary.text, reply.ok and summary.ok)
         
     except json.JSONDecodeError as e:
-        return f"JSON parsing error: {e}. Raw response: '{response}'"
+        return ToolOutput(f"JSON parsing error: {e}. Raw response: '{response}'", False)
     except Exception as e:
-        return f"Troubleshooting error: {str(e)}"
+        return ToolOutput(f"Troubleshooting error: {str(e)}", False)
+
+
+async def run_diagnosis(input_text: str) -> str:
+    """Run system diagnosis to find probable issues"""
+    return (await _run_diagnosis(input_text)).text
+
+async def get_pc_settings(input_text: str) -> str:
+    """Get PC settings information"""
+    return (await _get_pc_settings(input_text)).text
+
+async def execute_troubleshooting(input_text: str) -> str:
+    """Execute troubleshooting commands"""
+    return (await _execute_troubleshooting(input_text)).text
+
 
+# Body of a leading markdown code fence, up to the closing fence (or end of text)
+JSON_FENCE_PATTERN = re.compile(r"\A```[^\n]*\n?(.*?)(?:^\s*```|\Z)", re.DOTALL | re.MULTILINE)
 
 def extract_json_from_response(response: str) -> str:
     """Extract JSON from markdown code blocks or return as-is"""
-    # Remove markdown code blocks if present
-    if response.strip().startswith('```'):
-        # Find content between ```json and ```
-        lines = response.strip().split('\n')
-        json_lines = []
-        in_json = False
-        for line in lines:
-            if line.strip().startswith('```json') or line.strip().startswith('```'):
-                in_json = not in_json
-                continue
-            if in_json:
-                json_lines.append(line)
-        return '\n'.join(json_lines).strip()
-    return response.strip()
+    response = response.strip()
+    match = JSON_FENCE_PATTERN.match(response)
+    if match:
+        return match.group(1).strip()
+    return response
 
 
 
 
+# Tool registry: name -> description, public function (text only) and
+# handler (ToolOutput, used by the server to decide what may be cached)
+TOOLS: Dict[str, Dict[str, Any]] = {
+    "run_diagnosis": {
+        "description": "Run system diagnosis to find probable issues",
+        "function": run_diagnosis,
+        "handler": _run_diagnosis
+    },
+    "get_pc_settings": {
+        "description": "Get PC settings like volume, WiFi, battery, etc.",
+        "function": get_pc_settings,
+        "handler": _get_pc_settings
+    },
+    "execute_troubleshooting": {
+        "description": "Execute troubleshooting commands to fix issues",
+        "function": execute_troubleshooting,
+        "handler": _execute_troubleshooting
+    }
+}
+
+# The tool list is static, so build the MCP response once
+TOOLS_RESULT = ListToolsResult(
+    tools=[
+        Tool(
+            name=name,
+            description=info["description"],
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "input_text": {
+                        "type": "string",
+                        "description": "The user's request or issue description"
+                    }
+                },
+                "required": ["input_text"]
+            }
+        )
+        for name, info in TOOLS.items()
+    ]
+)
+
+
 # MCP Server Implementation
 class SimpleTalkToPCServer:
     def __init__(self):
-        self.tools = {
-            "run_diagnosis": {
-                "description": "Run system diagnosis to find probable issues",
-                "function": run_diagnosis
-            },
-            "get_pc_settings": {
-                "description": "Get PC settings like volume, WiFi, battery, etc.",
-                "function": get_pc_settings  
-            },
-            "execute_troubleshooting": {
-                "description": "Execute troubleshooting commands to fix issues",
-                "function": execute_troubleshooting
-            }
-        }
+        self.tools = TOOLS
+        self.semantic_cache = create_semantic_cache()
 
     async def list_tools(self, request: ListToolsRequest) -> ListToolsResult:
         """List available tools"""
-        return ListToolsResult(
-            tools=[
-                Tool(
-                    name=name,
-                    description=info["description"],
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "input_text": {
-                                "type": "string",
-                                "description": "The user's request or issue description"
-                            }
-                        },
-                        "required": ["input_text"]
-                    }
-                )
-                for name, info in self.tools.items()
-            ]
-        )
+        return TOOLS_RESULT
 
     async def call_tool(self, request: CallToolRequest) -> CallToolResult:
         """Execute a tool"""
@@ -276,7 +366,8 @@ class SimpleTalkToPCServer:
             tool_name = request.params.name
             arguments = request.params.arguments or {}
             
-            if tool_name not in self.tools:
+            tool = self.tools.get(tool_name)
+            if tool is None:
                 return CallToolResult(
                     content=[TextContent(
                         type="text",
@@ -296,8 +387,25 @@ class SimpleTalkToPCServer:
                     isError=True
                 )
             
+            # Serve rephrasings of a recent request from the semantic cache
+            embedding = None
+            if self.semantic_cache is not None and tool_name in CACHEABLE_TOOLS:
+                embedding = await asyncio.to_thread(self.semantic_cache.embed, input_text)
+                cached = self.semantic_cache.lookup(tool_name, embedding)
+                if cached is not None:
+                    return CallToolResult(
+                        content=[TextContent(
+                            type="text",
+                            text=cached
+                        )]
+                    )
+            
             # Execute the tool
-            result = await self.tools[tool_name]["function"](input_text)
+            result, ok = await tool["handler"](input_text)
+            
+            # Only cache results where every step succeeded
+            if embedding is not None and ok:
+                self.semantic_cache.add(tool_name, embedding, input_text, result)
             
             return CallToolResult(
                 content=[TextContent(
@@ -317,8 +425,6 @@ class SimpleTalkToPCServer:
 
 
 
-from mcp.types import CallToolRequestParams, ServerCapabilities
-
 async def main():
     """Run the MCP server"""
     server_instance = SimpleTalkToPCServer()
@@ -340,7 +446,8 @@ async def main():
             result = await server_instance.call_tool(request)
             return result.content
         
-        print(f"🚀 Talk to Your PC MCP Server running on {OS_TYPE}")
+        # stdout carries the MCP protocol, so status goes to the logger (stderr)
+        logger.info("🚀 Talk to Your PC MCP Server running on %s", OS_TYPE)
         
         await server.run(
             read_stream,
@@ -1,20 +1,20 @@
 #!/usr/bin/env python3
 """
 Test and Debug Script for Talk to PC MCP Server
-Run this from the project root directory
+Install the package first (pip install -e .), then run this from the project root directory
 """
 
 import os
 import sys
 import asyncio
+import gc
 import json
+import threading
 import traceback
 from pathlib import Path
 
-# Add src to Python path for testing
 project_root = Path(__file__).parent
 src_path = project_root / "src"
-sys.path.insert(0, str(src_path))
 
 print("=" * 60)
 print("Talk to PC MCP Server - Test & Debug Script")
@@ -74,6 +74,7 @@ def test_imports():
         
     except ImportError as e:
         print(f"❌ Import failed: {e}")
+        print("Install the package first: pip install -e .")
         traceback.print_exc()
         return False
 
@@ -83,7 +84,8 @@ def test_llm_client():
     print("-" * 30)
     
     try:
-        from talk_to_your_pc_mcp_server.llm_config import get_llm_response, LLMClientFactory
+        from talk_to_your_pc_mcp_server.llm_config import get_llm_response, get_cache_stats, LLMClientFactory
+        from talk_to_your_pc_mcp_server.server import extract_json_from_response
         
         # Test factory
         client = LLMClientFactory.create_client()
@@ -101,23 +103,11 @@ def test_llm_client():
         
         print(f"LLM response: {response}")
         print(f"Response length: {len(response)}")
+        print(f"LLM cache stats: {get_cache_stats()}")
         
         # Test JSON parsing
         try:
-            if response.strip().startswith('```'):
-                # Handle markdown
-                lines = response.strip().split('\n')
-                json_lines = []
-                in_json = False
-                for line in lines:
-                    if line.strip().startswith('```'):
-                        in_json = not in_json
-                        continue
-                    if in_json:
-                        json_lines.append(line)
-                clean_response = '\n'.join(json_lines).strip()
-            else:
-                clean_response = response.strip()
+            clean_response = extract_json_from_response(response)
             
             parsed = json.loads(clean_response)
             print(f"✅ JSON parsing successful: {parsed}")
@@ -141,21 +131,20 @@ async def test_mcp_functions():
     try:
         from talk_to_your_pc_mcp_server.server import run_diagnosis, get_pc_settings, execute_troubleshooting
         
-        result = await get_pc_settings("what is my username")
-        print(f"✅ get_pc_settings result: {result[:100]}...")
-        print("\n\n\n-----------------------------------------------------------------------------")
-
-
-        result = await run_diagnosis("check system memory usage")
-        print(f"✅ run_diagnosis result: {result[:100]}...")
-        print("\n\n\n-----------------------------------------------------------------------------")
-
+        # The calls are independent, so run them concurrently
+        calls = [
+            ("get_pc_settings", get_pc_settings("what is my username")),
+            ("run_diagnosis", run_diagnosis("check system memory usage")),
+            ("execute_troubleshooting", execute_troubleshooting("check disk space")),
+        ]
+        results = await asyncio.gather(*(coro for _, coro in calls), return_exceptions=True)
         
-
-        result = await execute_troubleshooting("check disk space")
-        print(f"✅ execute_troubleshooting result: {result[:100]}...")
-        print("\n\n\n-----------------------------------------------------------------------------")
-
+        for (name, _), result in zip(calls, results):
+            if isinstance(result, BaseException):
+                print(f"❌ {name} failed: {result}")
+            else:
+                print(f"✅ {name} result: {result[:100]}...")
+            print("\n\n\n-----------------------------------------------------------------------------")
         
         return True
         
@@ -191,28 +180,19 @@ def test_json_extraction():
     print("\n6. JSON Extraction Test:")
     print("-" * 30)
     
-    def extract_json_from_response(response: str) -> str:
-        """Extract JSON from markdown code blocks or return as-is"""
-        if response.strip().startswith('```'):
-            lines = response.strip().split('\n')
-            json_lines = []
-            in_json = False
-            for line in lines:
-                if line.strip().startswith('```'):
-                    in_json = not in_json
-                    continue
-                if in_json:
-                    json_lines.append(line)
-            return '\n'.join(json_lines).strip()
-        return response.strip()
+    from talk_to_your_pc_mcp_server.server import extract_json_from_response
     
     # Test cases
     test_cases = [
         '{"command": "echo test"}',  # Plain JSON
         '```json\n{"command": "echo test"}\n```',  # Markdown JSON
         '```\n{"command": "echo test"}\n```',  # Markdown without json label
+        '```json\n{"command": "echo test"}',  # Unterminated fence
+        '```json\n{"command": "echo test"}\n```\nRun this to check.',  # Text after closing fence
+        '  ```json\n{"command":\n "echo test"}\n  ```  ',  # Surrounding whitespace, multi-line body
     ]
     
+    all_ok = True
     for i, test_case in enumerate(test_cases):
         try:
             extracted = extract_json_from_response(test_case)
@@ -220,8 +200,246 @@ def test_json_extraction():
             print(f"✅ Test case {i+1}: {parsed}")
         except Exception as e:
             print(f"❌ Test case {i+1} failed: {e}")
+            all_ok = False
     
-    return True
+    return all_ok
+
+def check(label: str, passed: bool) -> bool:
+    """Print a pass/fail line for an offline check"""
+    print(f"{'✅' if passed else '❌'} {label}")
+    return passed
+
+def test_llm_cache():
+    """Test LLM response cache eviction and error handling (no API key needed)"""
+    print("\n7. LLM Cache Test:")
+    print("-" * 30)
+    
+    from talk_to_your_pc_mcp_server import llm_config
+    from talk_to_your_pc_mcp_server.llm_config import BaseLLMClient, LLMCache, LLMClientFactory, LLMError
+    
+    results = []
+    
+    # LRU: reading "a" makes "b" the oldest entry, so adding "c" evicts "b"
+    cache = LLMCache(maxsize=2, ttl_seconds=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.get("a")
+    cache.set("c", "C")
+    results.append(check("LRU evicts least recently used entry",
+                         cache.get("b") is None and cache.get("a") == "A" and cache.get("c") == "C"))
+    results.append(check("Hit/miss counters", cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1))
+    
+    # TTL: with a zero TTL every entry is already expired
+    cache = LLMCache(maxsize=2, ttl_seconds=0)
+    cache.set("a", "A")
+    results.append(check("Expired entry is not returned", cache.get("a") is None and cache.stats()["size"] == 0))
+    
+    # Error fallbacks from the provider must not be cached
+    class FakeClient(BaseLLMClient):
+        provider_name = "Fake"
+        model = "fake-model"
+        replies = [LLMError("Empty response from Fake"), RuntimeError("boom"), "ok"]
+        calls = 0
+        
+        def generate(self, system_prompt: str, user_prompt: str) -> str:
+            FakeClient.calls += 1
+            reply = FakeClient.replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+    
+    original_create_client = LLMClientFactory.create_client
+    LLMClientFactory.create_client = staticmethod(FakeClient)
+    llm_config.llm_cache.clear()
+    try:
+        first = llm_config.get_llm_result("system", "user")
+        second = llm_config.get_llm_result("system", "user")
+        third = llm_config.get_llm_result("system", "user")
+        fourth = llm_config.get_llm_result("system", "user")
+    finally:
+        LLMClientFactory.create_client = original_create_client
+    
+    results.append(check("Empty response is flagged and not cached",
+                         not first.ok and "Empty response from Fake" in first.text))
+    results.append(check("Provider error is flagged and not cached",
+                         not second.ok and "Fake Error: boom" in second.text))
+    results.append(check("Successful response is served from cache",
+                         third == fourth == ("ok", True) and FakeClient.calls == 3))
+    print(f"LLM cache stats: {llm_config.get_cache_stats()}")
+    llm_config.llm_cache.clear()
+    
+    return all(results)
+
+async def test_semantic_cache():
+    """Test semantic cache expiry, trimming and failure handling (no API key needed)"""
+    print("\n8. Semantic Cache Test:")
+    print("-" * 30)
+    
+    try:
+        import numpy as np
+    except ImportError:
+        print("⚠️  numpy not installed, skipping (pip install -e .[semantic])")
+        return True
+    
+    from talk_to_your_pc_mcp_server.semantic_cache import SemanticCache
+    from talk_to_your_pc_mcp_server.server import SimpleTalkToPCServer, ToolOutput
+    from mcp.types import CallToolRequest, CallToolRequestParams
+    
+    # Fake unit-length embeddings: x and a near-duplicate of it, plus an orthogonal y
+    x = np.array([1.0, 0.0, 0.0])
+    near_x = np.array([0.95, np.sqrt(1 - 0.95 ** 2), 0.0])
+    y = np.array([0.0, 1.0, 0.0])
+    
+    results = []
+    
+    cache = SemanticCache(threshold=0.92, ttl_seconds=60, maxsize=2)
+    cache.add("run_diagnosis", x, "why is my pc slow", "diagnosis")
+    results.append(check("Similar input hits", cache.lookup("run_diagnosis", near_x) == "diagnosis"))
+    results.append(check("Dissimilar input misses", cache.lookup("run_diagnosis", y) is None))
+    results.append(check("Tools don't share entries", cache.lookup("get_pc_settings", x) is None))
+    
+    cache.add("run_diagnosis", near_x, "my pc is sluggish", "duplicate diagnosis")
+    results.append(check("Near-duplicate result is not added twice",
+                         len(cache._indexes["run_diagnosis"].entries) == 1
+                         and cache.lookup("run_diagnosis", near_x) == "diagnosis"))
+    
+    cache.add("run_diagnosis", y, "wifi", "wifi result")
+    cache.add("run_diagnosis", np.array([0.0, 0.0, 1.0]), "disk", "disk result")
+    results.append(check("maxsize trims the oldest entry",
+                         cache.lookup("run_diagnosis", x) is None
+                         and cache.lookup("run_diagnosis", y) == "wifi result"))
+    
+    cache = SemanticCache(threshold=0.92, ttl_seconds=0)
+    cache.add("run_diagnosis", x, "why is my pc slow", "diagnosis")
+    results.append(check("Expired entries are dropped",
+                         cache.lookup("run_diagnosis", x) is None and not cache._indexes["run_diagnosis"].entries))
+    
+    # call_tool only caches results where every step succeeded
+    outputs = [ToolOutput("Diagnosis failed: boom", False), ToolOutput("all good", True), ToolOutput("unused", True)]
+    
+    async def fake_handler(input_text: str) -> ToolOutput:
+        return outputs.pop(0)
+    
+    server = SimpleTalkToPCServer()
+    server.tools = {"run_diagnosis": {"handler": fake_handler}}
+    server.semantic_cache = SemanticCache(threshold=0.92, ttl_seconds=60)
+    server.semantic_cache.embed = lambda text: x
+    
+    texts = []
+    for _ in range(3):
+        request = CallToolRequest(
+            params=CallToolRequestParams(name="run_diagnosis", arguments={"input_text": "why is my pc slow"})
+        )
+        texts.append((await server.call_tool(request)).content[0].text)
+    
+    results.append(check("Failed result is not cached", texts[1] == "all good"))
+    results.append(check("Successful result is served from cache", texts[2] == "all good" and len(outputs) == 1))
+    
+    return all(results)
+
+async def test_llm_coalescing():
+    """Test that identical concurrent LLM calls share one request (no API key needed)"""
+    print("\n9. LLM Call Coalescing Test:")
+    print("-" * 30)
+    
+    from talk_to_your_pc_mcp_server import llm_config, server
+    from talk_to_your_pc_mcp_server.llm_config import BaseLLMClient, LLMClientFactory, LLMResult
+    
+    class FakeClient(BaseLLMClient):
+        model = "fake-model"
+        
+        def generate(self, system_prompt: str, user_prompt: str) -> str:
+            raise AssertionError("provider should be reached through fetch_llm_result")
+    
+    calls = []
+    release = threading.Event()
+    
+    def fake_fetch(client, key: str, system_prompt: str, user_prompt: str) -> LLMResult:
+        calls.append(user_prompt)
+        release.wait(5)
+        if user_prompt == "fail":
+            raise RuntimeError("provider down")
+        return LLMResult(f"reply to {user_prompt}", True)
+    
+    results = []
+    original_create_client = LLMClientFactory.create_client
+    original_fetch = server.fetch_llm_result
+    LLMClientFactory.create_client = staticmethod(FakeClient)
+    server.fetch_llm_result = fake_fetch
+    llm_config.llm_cache.clear()
+    try:
+        # Identical prompts in flight together share one call
+        tasks = [asyncio.ensure_future(server._llm("system", "same")) for _ in range(3)]
+        tasks.append(asyncio.ensure_future(server._llm("system", "other")))
+        await asyncio.sleep(0.1)
+        release.set()
+        replies = await asyncio.gather(*tasks)
+        results.append(check("Identical concurrent prompts share one call",
+                             calls.count("same") == 1 and all(r.text == "reply to same" for r in replies[:3])))
+        results.append(check("Different prompts are not coalesced",
+                             calls.count("other") == 1 and replies[3].text == "reply to other"))
+        results.append(check("Finished calls leave the in-flight map", not server._inflight_llm))
+        
+        # Cancelling one caller doesn't cancel the shared call for the others
+        release.clear()
+        calls.clear()
+        first = asyncio.ensure_future(server._llm("system", "cancel"))
+        second = asyncio.ensure_future(server._llm("system", "cancel"))
+        await asyncio.sleep(0.1)
+        first.cancel()
+        release.set()
+        reply = await second
+        results.append(check("Cancelled caller doesn't cancel the shared call",
+                             first.cancelled() and reply.text == "reply to cancel" and calls == ["cancel"]))
+        
+        # An exception reaches every waiter and the next call starts afresh
+        calls.clear()
+        outcomes = await asyncio.gather(server._llm("system", "fail"), server._llm("system", "fail"),
+                                        return_exceptions=True)
+        results.append(check("Exception is raised to every waiter",
+                             all(isinstance(o, RuntimeError) for o in outcomes) and calls == ["fail"]))
+        await asyncio.gather(server._llm("system", "fail"), return_exceptions=True)
+        results.append(check("Failed call is not reused", calls == ["fail", "fail"] and not server._inflight_llm))
+        
+        # A failure after every waiter was cancelled is consumed quietly
+        loop = asyncio.get_running_loop()
+        unhandled = []
+        loop.set_exception_handler(lambda _, context: unhandled.append(context))
+        release.clear()
+        orphan = asyncio.ensure_future(server._llm("system", "fail"))
+        await asyncio.sleep(0.1)
+        orphan.cancel()
+        release.set()
+        while server._inflight_llm:
+            await asyncio.sleep(0.05)
+        # The cancelled caller's traceback references the shared task; drop it so it can be collected
+        del orphan
+        gc.collect()
+        loop.set_exception_handler(None)
+        results.append(check("Orphaned failure is not reported as unhandled", not unhandled))
+        
+        # Cache hits don't wait for a semaphore slot held by a slow provider call
+        server._llm_semaphores[asyncio.get_running_loop()] = asyncio.Semaphore(1)
+        key = llm_config.llm_cache_key(FakeClient(), "system", "cached")
+        llm_config.llm_cache.set(key, "cached reply")
+        release.clear()
+        slow = asyncio.ensure_future(server._llm("system", "slow"))
+        await asyncio.sleep(0.1)
+        try:
+            reply = await asyncio.wait_for(server._llm("system", "cached"), timeout=1)
+            cache_hit_ok = reply == ("cached reply", True)
+        except asyncio.TimeoutError:
+            cache_hit_ok = False
+        release.set()
+        await slow
+        results.append(check("Cache hit bypasses a full semaphore", cache_hit_ok))
+    finally:
+        release.set()
+        LLMClientFactory.create_client = original_create_client
+        server.fetch_llm_result = original_fetch
+        llm_config.llm_cache.clear()
+    
+    return all(results)
 
 def run_all_tests():
     """Run all tests"""
@@ -238,8 +456,14 @@ def run_all_tests():
         print("\n❌ Import tests failed. Cannot continue.")
         return False
     
-    # Test 3: JSON extraction
-    test_json_extraction()
+    # Test 3: JSON extraction and offline cache checks (no API key needed)
+    offline_results = {
+        "JSON extraction": test_json_extraction(),
+        "LLM cache": test_llm_cache(),
+        "Semantic cache": asyncio.run(test_semantic_cache()),
+        "LLM call coalescing": asyncio.run(test_llm_coalescing()),
+    }
+    offline_failures = [name for name, passed in offline_results.items() if not passed]
     
     if has_api_key:
         # Test 4: LLM client
@@ -255,6 +479,10 @@ def run_all_tests():
     print("\n" + "=" * 60)
     print("Test Summary:")
     print("=" * 60)
+    if offline_failures:
+        print(f"❌ Offline checks failed: {', '.join(offline_failures)}")
+        return False
+    
     if has_api_key:
         print("✅ All tests completed!")
         print("\nTo run the MCP server:")
@@ -269,9 +497,12 @@ def run_all_tests():
 
 if __name__ == "__main__":
     try:
-        run_all_tests()
+        passed = run_all_tests()
     except KeyboardInterrupt:
         print("\n\nTest interrupted by user.")
+        sys.exit(130)
     except Exception as e:
         print(f"\n❌ Unexpected error: {e}")
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+        sys.exit(1)
+    sys.exit(0 if passed else 1)
\ No newline at end of file